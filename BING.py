@@ -1,25 +1,87 @@
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import xml.etree.ElementTree as ET
+import argparse
+import codecs
 import hashlib
+import io
 import os
-import glob
+import posixpath
+import sys
 import json
+try:
+    import orjson
+except ImportError:
+    orjson = None
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-import time
-from urllib.parse import urlparse
+from urllib.parse import quote
+
+# 服务器返回304时download_sitemap的返回值，表示sitemap未发生变化
+UNCHANGED = object()
+
+
+def _json_loads(data):
+    """解析JSON（bytes或str），优先使用orjson"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _json_dumps(obj):
+    """序列化为UTF-8编码的紧凑JSON字节串，优先使用orjson"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+# 预先拼好的sitemap命名空间限定标签名（Clark格式），解析时直接比较
+_SITEMAP_NS = 'http://www.sitemaps.org/schemas/sitemap/0.9'
+_NS = '{' + _SITEMAP_NS + '}'
+_URL = _NS + 'url'
+_LOC = _NS + 'loc'
+_LASTMOD = _NS + 'lastmod'
+_SMAP = _NS + 'sitemap'
+_SMAP_INDEX = _NS + 'sitemapindex'
 
 class SmartIndexNowSubmitter:
     def __init__(self, storage_dir="sitemap_data", max_history=20):
         self.storage_dir = storage_dir
-        self.history_file = os.path.join(storage_dir, "历史提交.txt")
+        self.history_file = os.path.join(storage_dir, "历史提交.ndjson")
         self.max_history = max_history
         self.settings_file = os.path.join(storage_dir, "Settings.json")
+        self.urls_cache_file = os.path.join(storage_dir, "urls.json")
+        self._sitemap_entries_cache = None  # 本地sitemap文件列表缓存，文件变动时失效
         
         # 创建存储目录
         os.makedirs(storage_dir, exist_ok=True)
         
         # 加载配置
+        self.settings = None  # 读取失败时保持None，避免写回覆盖用户配置
         self.sitemap_url, self.host, self.key = self.load_settings()
+        state = self.settings or {}
+        self.last_hash = state.get("last_hash")
+        self.etag = state.get("etag")
+        self.last_modified = state.get("last_modified")
+        
+        # 本次下载响应中的缓存校验头，保存sitemap时一并记录
+        self._response_etag = None
+        self._response_last_modified = None
+        
+        # 所有HTTP请求复用同一会话（keep-alive + 连接池 + 失败重试）
+        # 429/5xx按Retry-After或指数退避自动重试，IndexNow重复提交是安全的，因此POST也重试
+        retry = Retry(
+            total=3,
+            backoff_factor=0.5,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=['GET', 'POST'],
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=16, pool_maxsize=16, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
         
     def load_settings(self):
         """从Settings.json文件加载配置"""
@@ -33,8 +95,7 @@ class SmartIndexNowSubmitter:
         if not os.path.exists(self.settings_file):
             print(f"配置文件不存在，创建默认配置: {self.settings_file}")
             try:
-                with open(self.settings_file, 'w', encoding='utf-8') as f:
-                    json.dump(default_settings, f, indent=4, ensure_ascii=False)
+                self._write_settings_file(default_settings)
                 print("✓ 默认配置文件已创建，请检查配置是否正确")
             except Exception as e:
                 print(f"创建配置文件失败: {e}")
@@ -42,8 +103,9 @@ class SmartIndexNowSubmitter:
         
         # 读取配置文件
         try:
-            with open(self.settings_file, 'r', encoding='utf-8') as f:
-                settings = json.load(f)
+            with open(self.settings_file, 'rb') as f:
+                settings = _json_loads(f.read())
+            self.settings = settings
             
             # 检查必要配置项
             sitemap_url = settings.get("sitemap_url", default_settings["sitemap_url"])
@@ -57,142 +119,314 @@ class SmartIndexNowSubmitter:
             print(f"读取配置文件失败: {e}，使用默认配置")
             return default_settings.values()
     
+    def _write_settings_file(self, settings):
+        """先写临时文件再原子替换，写入中断时不会破坏已有配置"""
+        tmp_file = self.settings_file + '.part'
+        with open(tmp_file, 'wb') as f:
+            # 配置文件由用户手动编辑，保持原有的4空格缩进（orjson只支持2空格）
+            f.write(json.dumps(settings, indent=4, ensure_ascii=False).encode('utf-8'))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self.settings_file)
+    
+    def save_settings(self):
+        """将当前配置（含运行状态）写回Settings.json"""
+        if self.settings is None:
+            return False
+            
+        try:
+            self._write_settings_file(self.settings)
+            return True
+        except Exception as e:
+            print(f"保存配置文件失败: {e}")
+            return False
+    
+    def save_sitemap_state(self, content_hash):
+        """记录最新sitemap的哈希值及ETag/Last-Modified，下次运行时无需重新读取本地文件"""
+        self.last_hash = content_hash
+        self.etag = self._response_etag
+        self.last_modified = self._response_last_modified
+        if self.settings is not None:
+            self.settings["last_hash"] = self.last_hash
+            self.settings["etag"] = self.etag
+            self.settings["last_modified"] = self.last_modified
+            # 旧版本写入的SAX快速路径标记已不再使用
+            self.settings.pop("loc_only", None)
+        return self.save_settings()
+    
+    def clear_sitemap_state(self):
+        """本地sitemap缺失时清除记录的哈希值及ETag/Last-Modified，避免误判为未变化"""
+        self._response_etag = None
+        self._response_last_modified = None
+        return self.save_sitemap_state(None)
+    
+    def _sitemap_entries(self):
+        """单次扫描存储目录，返回本地sitemap文件的DirEntry列表"""
+        if self._sitemap_entries_cache is None:
+            with os.scandir(self.storage_dir) as it:
+                self._sitemap_entries_cache = [e for e in it if e.name.startswith("sitemap_") and e.name.endswith(".xml")]
+        return self._sitemap_entries_cache
+    
     def get_latest_sitemap_file(self):
         """获取最新的本地sitemap文件"""
-        sitemap_files = [f for f in os.listdir(self.storage_dir) if f.startswith("sitemap_") and f.endswith(".xml")]
-        if not sitemap_files:
-            return None
-            
-        # 按文件名排序（文件名包含日期），返回最新的
-        latest_file = sorted(sitemap_files)[-1]
-        return os.path.join(self.storage_dir, latest_file)
+        # 文件名包含日期，名称最大的即为最新
+        latest_entry = max(self._sitemap_entries(), key=lambda e: e.name, default=None)
+        return latest_entry.path if latest_entry else None
     
     def get_new_sitemap_filename(self):
         """生成新的sitemap文件名"""
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         return os.path.join(self.storage_dir, f"sitemap_{timestamp}.xml")
     
-    def calculate_hash(self, content):
-        """计算内容的SHA-256哈希值"""
-        return hashlib.sha256(content).hexdigest()
+    def _hash_file(self, path):
+        """分块计算文件的SHA-256哈希值，不将整个文件读入内存"""
+        with open(path, 'rb') as f:
+            if hasattr(hashlib, 'file_digest'):
+                return hashlib.file_digest(f, 'sha256').hexdigest()
+            
+            # Python 3.11以下没有hashlib.file_digest
+            sha256 = hashlib.sha256()
+            for chunk in iter(lambda: f.read(65536), b''):
+                sha256.update(chunk)
+            return sha256.hexdigest()
     
-    def download_sitemap(self):
-        """下载sitemap.xml文件"""
+    def download_sitemap(self, filename):
+        """流式下载sitemap.xml到临时文件，同时计算哈希，返回(临时文件路径, 哈希值)
+        
+        本地已有sitemap时发送条件请求，服务器返回304则返回UNCHANGED
+        """
+        tmp_filename = filename + '.part'
+        
+        # sitemap索引返回304时子sitemap仍可能已变化，因此只对普通sitemap发送条件请求
+        headers = {}
+        latest_file = self.get_latest_sitemap_file()
+        if latest_file and not self._is_sitemap_index(latest_file):
+            if self.etag:
+                headers['If-None-Match'] = self.etag
+            if self.last_modified:
+                headers['If-Modified-Since'] = self.last_modified
+        
         try:
-            response = requests.get(self.sitemap_url, timeout=10)
-            response.raise_for_status()
-            return response.content
-        except requests.exceptions.RequestException as e:
+            with self.session.get(self.sitemap_url, headers=headers, stream=True, timeout=10) as response:
+                if response.status_code == 304:
+                    return UNCHANGED
+                    
+                response.raise_for_status()
+                self._response_etag = response.headers.get('ETag')
+                self._response_last_modified = response.headers.get('Last-Modified')
+                sha256 = hashlib.sha256()
+                size = 0
+                with open(tmp_filename, 'wb', buffering=1 << 20) as f:
+                    for chunk in response.iter_content(65536):
+                        sha256.update(chunk)
+                        f.write(chunk)
+                        size += len(chunk)
+                    # 确保数据落盘后再由save_sitemap原子替换，避免崩溃后留下不完整的sitemap
+                    f.flush()
+                    os.fsync(f.fileno())
+            
+            # 空响应不是有效的sitemap，不能当作"所有URL已删除"处理
+            if size == 0:
+                print("下载sitemap失败: 服务器返回了空内容")
+                os.remove(tmp_filename)
+                return None
+            return tmp_filename, sha256.hexdigest()
+        except (requests.exceptions.RequestException, IOError) as e:
             print(f"下载sitemap失败: {e}")
+            if os.path.exists(tmp_filename):
+                os.remove(tmp_filename)
             return None
     
-    def save_sitemap(self, content, filename):
-        """保存sitemap到本地文件"""
+    def save_sitemap(self, tmp_filename, filename, content_hash):
+        """将下载好的临时文件原子替换为正式sitemap文件，并记录其哈希值"""
         try:
-            with open(filename, 'wb') as f:
-                f.write(content)
+            os.replace(tmp_filename, filename)
+            self._sitemap_entries_cache = None
             print(f"Sitemap已保存到: {filename}")
-            return True
-        except IOError as e:
+        except OSError as e:
             print(f"保存sitemap文件失败: {e}")
             return False
+        return self.save_sitemap_state(content_hash)
     
-    def parse_sitemap_urls(self, xml_content):
-        """解析sitemap.xml文件，提取所有URL及其lastmod"""
-        urls_data = {}
+    def save_urls_cache(self, urls_data, content_hash):
+        """缓存sitemap解析结果，下次比较时无需重新解析旧的XML"""
+        tmp_file = self.urls_cache_file + '.part'
         try:
-            root = ET.fromstring(xml_content)
-            
-            # 命名空间处理
-            namespace = {'ns': 'http://www.sitemaps.org/schemas/sitemap/0.9'}
+            with open(tmp_file, 'wb') as f:
+                f.write(_json_dumps({"hash": content_hash, "urls": urls_data}))
+            os.replace(tmp_file, self.urls_cache_file)
+        except Exception as e:
+            print(f"保存URL缓存失败: {e}")
+            # 避免残留与最新sitemap不一致的缓存
+            for path in (tmp_file, self.urls_cache_file):
+                if os.path.exists(path):
+                    os.remove(path)
+    
+    def load_urls_cache(self, content_hash):
+        """读取与指定哈希值对应的URL缓存，缓存缺失、格式不符或不匹配时返回None"""
+        if not os.path.exists(self.urls_cache_file):
+            return None
             
-            # 查找所有url条目
-            for url_entry in root.findall('ns:url', namespace):
-                loc_elem = url_entry.find('ns:loc', namespace)
-                lastmod_elem = url_entry.find('ns:lastmod', namespace)
-                
-                if loc_elem is not None:
-                    url = loc_elem.text
-                    lastmod = lastmod_elem.text if lastmod_elem is not None else None
-                    urls_data[url] = lastmod
-                
-            # 处理嵌套的sitemap索引文件
-            for sitemap in root.findall('ns:sitemap/ns:loc', namespace):
-                print(f"发现嵌套sitemap: {sitemap.text}")
-                # 这里可以添加递归下载嵌套sitemap的逻辑
+        try:
+            with open(self.urls_cache_file, 'rb') as f:
+                cache = _json_loads(f.read())
+        except Exception as e:
+            print(f"读取URL缓存失败: {e}")
+            return None
+        
+        if not isinstance(cache, dict) or cache.get("hash") != content_hash:
+            return None
+        urls_data = cache.get("urls")
+        return urls_data if isinstance(urls_data, dict) else None
+    
+    def _is_sitemap_index(self, path):
+        """只读取根元素，判断文件是否为sitemap索引"""
+        try:
+            for _, elem in ET.iterparse(path, events=("start",)):
+                return elem.tag == _SMAP_INDEX
+        except ET.ParseError:
+            pass
+        return False
+    
+    def _fetch_child_sitemap(self, url):
+        """下载嵌套的子sitemap，失败时返回None"""
+        try:
+            response = self.session.get(url, timeout=10)
+            response.raise_for_status()
+            return response.content
+        except requests.exceptions.RequestException as e:
+            print(f"下载嵌套sitemap失败 {url}: {e}")
+            return None
+    
+    def parse_sitemap_urls(self, xml_source, fetch_children=True):
+        """解析sitemap.xml（文件路径或字节内容），提取所有URL及其lastmod，解析失败时返回None
+        
+        遇到sitemap索引时并发下载其中的子sitemap并合并结果，任一子sitemap下载或解析失败都返回None；
+        fetch_children为False时只记录不下载（用于解析旧的本地sitemap及子sitemap本身）
+        """
+        urls_data = {}
+        child_urls = []
+        
+        if isinstance(xml_source, bytes):
+            xml_source = io.BytesIO(xml_source)
+        
+        try:
+            # 逐个元素解析，处理完即释放，避免整棵树常驻内存
+            for _, elem in ET.iterparse(xml_source, events=("end",)):
+                if elem.tag == _URL:
+                    loc_elem = elem.find(_LOC)
+                    lastmod_elem = elem.find(_LASTMOD)
+                    
+                    if loc_elem is not None:
+                        url = loc_elem.text
+                        lastmod = lastmod_elem.text if lastmod_elem is not None else None
+                        urls_data[url] = lastmod
+                        
+                elif elem.tag == _SMAP:
+                    # 处理嵌套的sitemap索引文件
+                    loc_elem = elem.find(_LOC)
+                    if loc_elem is not None:
+                        print(f"发现嵌套sitemap: {loc_elem.text}")
+                        child_urls.append(loc_elem.text)
+                else:
+                    continue
+                    
+                elem.clear()
                 
         except ET.ParseError as e:
             print(f"解析XML失败: {e}")
-            
+            return None
+        
+        if child_urls and fetch_children:
+            # 并发下载所有子sitemap，再逐个解析合并
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                bodies = list(executor.map(self._fetch_child_sitemap, child_urls))
+            # 缺少任一子sitemap都会把其中的URL误判为删除，因此整体视为失败
+            if any(body is None for body in bodies):
+                return None
+            for body in bodies:
+                # 协议不允许sitemap索引嵌套，子sitemap不再继续展开
+                child_data = self.parse_sitemap_urls(body, fetch_children=False)
+                if child_data is None:
+                    return None
+                urls_data.update(child_data)
+        
         return urls_data
     
     def compare_urls_and_filter_changes(self, current_urls, previous_urls):
         """比较两个URL集合，返回有变化的URL列表"""
-        new_urls = []
-        changed_urls = []
-        deleted_urls = []
+        current_keys = current_urls.keys()
+        previous_keys = previous_urls.keys()
         
-        # 检查新增和更新的URL
-        for url, lastmod in current_urls.items():
-            # 如果是新URL
-            if url not in previous_urls:
-                new_urls.append(url)
-                continue
-                
-            # 如果lastmod字段有变化
-            prev_lastmod = previous_urls[url]
-            if lastmod != prev_lastmod:
-                changed_urls.append(url)
+        # 利用字典键视图的集合运算求新增与删除的URL，再按sitemap中的顺序输出
+        new = current_keys - previous_keys
+        deleted = previous_keys - current_keys
+        new_urls = [url for url in current_urls if url in new]
+        deleted_urls = [url for url in previous_urls if url in deleted]
         
-        # 检查删除的URL
-        for url in previous_urls:
-            if url not in current_urls:
-                deleted_urls.append(url)
+        # 两边都有的URL中，lastmod字段有变化的视为更新
+        changed_urls = [url for url, lastmod in current_urls.items() if url not in new and lastmod != previous_urls[url]]
         
         return new_urls, changed_urls, deleted_urls
     
-    def submit_to_indexnow(self, urls, batch_size=100):
-        """提交URL到IndexNow服务"""
+    def _post_batch(self, api_url, data, batch_num, total_batches):
+        """提交单个批次"""
+        print(f"提交批次 {batch_num}/{total_batches} ({len(data['urlList'])} 个URL)...")
+        
+        try:
+            response = self.session.post(api_url, json=data, timeout=15)
+        except requests.exceptions.RequestException as e:
+            print(f"✗ 批次 {batch_num} 请求IndexNow API失败: {e}")
+            return False
+        
+        if response.status_code == 200:
+            print(f"✓ 批次 {batch_num} 提交成功")
+            return True
+        
+        print(f"✗ 批次 {batch_num} 提交失败: HTTP {response.status_code} - {response.text}")
+        return False
+    
+    def _auto_batch(self, urls, target_bytes=900_000):
+        """根据URL平均长度估算批次大小，使单次请求接近IndexNow上限（10000个URL/约1MB）"""
+        sample = urls[:64]
+        avg_len = max(1, sum(len(url) for url in sample) // len(sample))
+        # 每个URL在JSON中额外占用引号、逗号等约4字节
+        return max(100, min(10000, target_bytes // (avg_len + 4)))
+    
+    def submit_to_indexnow(self, urls, batch_size=None, max_workers=4):
+        """提交URL到IndexNow服务，未指定batch_size时自动计算"""
         if not urls:
             print("没有需要提交的URL")
             return True
             
+        if batch_size is None:
+            batch_size = self._auto_batch(urls)
+            
         api_url = "https://api.indexnow.org/indexnow"
         
         total_urls = len(urls)
-        successful_batches = 0
+        total_batches = (total_urls + batch_size - 1) // batch_size
         
         print(f"开始提交 {total_urls} 个URL到IndexNow...")
         
-        # 分批处理URL，避免单次请求过大
-        for i in range(0, total_urls, batch_size):
-            batch = urls[i:i+batch_size]
-            batch_num = i//batch_size + 1
-            total_batches = (total_urls + batch_size - 1) // batch_size
-            
-            # 构建请求数据
-            data = {
+        # 分批构建请求数据，避免单次请求过大
+        datas = [
+            {
                 "host": self.host,
                 "key": self.key,
                 "keyLocation": f"https://{self.host}/{self.key}.txt",
-                "urlList": batch
+                "urlList": urls[i:i+batch_size]
             }
-            
-            try:
-                print(f"提交批次 {batch_num}/{total_batches} ({len(batch)} 个URL)...")
-                response = requests.post(api_url, json=data)
-                
-                if response.status_code == 200:
-                    print(f"✓ 批次 {batch_num} 提交成功")
-                    successful_batches += 1
-                else:
-                    print(f"✗ 批次 {batch_num} 提交失败: HTTP {response.status_code} - {response.text}")
-                    
-                # 避免请求过于频繁
-                time.sleep(1)
-                
-            except requests.exceptions.RequestException as e:
-                print(f"✗ 批次 {batch_num} 请求IndexNow API失败: {e}")
+            for i in range(0, total_urls, batch_size)
+        ]
+        
+        # 并发提交，并发数保持较低以免触发限流
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [
+                executor.submit(self._post_batch, api_url, data, batch_num, total_batches)
+                for batch_num, data in enumerate(datas, 1)
+            ]
+            successful_batches = sum(1 for future in futures if future.result())
         
         success_rate = (successful_batches / total_batches) * 100 if total_batches > 0 else 0
         print(f"提交完成: {successful_batches}/{total_batches} 批次成功 ({success_rate:.1f}%)")
@@ -200,75 +434,94 @@ class SmartIndexNowSubmitter:
         return successful_batches == total_batches
     
     def save_submission_history(self, new_urls, changed_urls, deleted_urls, total_submitted):
-        """保存提交历史到文件"""
-        # 读取现有历史记录
-        history_entries = []
-        if os.path.exists(self.history_file):
-            try:
-                with open(self.history_file, 'r', encoding='utf-8') as f:
-                    content = f.read().strip()
-                    if content:
-                        entries = content.split('-' * 50 + '\n')
-                        for entry in entries:
-                            if entry.strip():
-                                history_entries.append(entry.strip())
-            except Exception as e:
-                print(f"读取历史记录失败: {e}")
-        
-        # 创建新记录
-        current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        new_entry = f"""提交时间: {current_time}
-新增提交: {len(new_urls)}个
-"""
-        # 添加新增URL详情
-        for url in new_urls:
-            new_entry += f"  + {url}\n"
-        
-        new_entry += f"更改提交: {len(changed_urls)}个\n"
-        
-        # 添加更改URL详情
-        for url in changed_urls:
-            new_entry += f"  * {url}\n"
-        
-        new_entry += f"删除路径: {len(deleted_urls)}个\n"
-        
-        # 添加删除URL详情
-        for url in deleted_urls:
-            new_entry += f"  - {url}\n"
-        
-        new_entry += f"总计提交: {total_submitted}个\n"
-        
-        # 将新记录添加到历史记录列表
-        history_entries.append(new_entry)
-        
-        # 限制记录数量
-        if len(history_entries) > self.max_history:
-            history_entries = history_entries[-self.max_history:]
+        """以NDJSON格式追加保存提交历史（每行一条记录）"""
+        entry = {
+            "ts": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "new": new_urls,
+            "changed": changed_urls,
+            "deleted": deleted_urls,
+            "total": total_submitted
+        }
         
-        # 写入文件
+        # 追加写入，无需读取和重写已有记录
         try:
-            with open(self.history_file, 'w', encoding='utf-8') as f:
-                f.write(('\n' + '-' * 50 + '\n').join(history_entries))
+            with open(self.history_file, 'ab', buffering=1 << 16) as f:
+                f.write(_json_dumps(entry) + b'\n')
             
             print(f"✓ 提交记录已保存到: {self.history_file}")
         except Exception as e:
             print(f"保存提交记录失败: {e}")
+            return
+        
+        self.rotate_submission_history()
+    
+    def rotate_submission_history(self):
+        """记录数超过上限两倍时，只保留最新的max_history条"""
+        try:
+            with open(self.history_file, 'rb') as f:
+                line_count = sum(1 for _ in f)
+            
+            if line_count <= self.max_history * 2:
+                return
+            
+            with open(self.history_file, 'r', encoding='utf-8') as f:
+                tail = deque(f, maxlen=self.max_history)
+            
+            tmp_file = self.history_file + '.part'
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                f.writelines(tail)
+            os.replace(tmp_file, self.history_file)
+        except Exception as e:
+            print(f"整理历史记录失败: {e}")
+    
+    def render_history(self):
+        """将最近的提交历史格式化为可读文本"""
+        if not os.path.exists(self.history_file):
+            return ""
+            
+        # 只保留最后max_history行，内存占用与历史文件大小无关
+        with open(self.history_file, 'r', encoding='utf-8') as f:
+            lines = deque(f, maxlen=self.max_history)
+        
+        separator = '\n' + '-' * 50 + '\n'
+        parts = []
+        for line in lines:
+            if not line.strip():
+                continue
+            entry = _json_loads(line)
+            
+            if parts:
+                parts.append(separator)
+            parts.append(f"提交时间: {entry['ts']}\n新增提交: {len(entry['new'])}个\n")
+            # 添加新增URL详情
+            parts.extend(f"  + {url}\n" for url in entry['new'])
+            
+            parts.append(f"更改提交: {len(entry['changed'])}个\n")
+            # 添加更改URL详情
+            parts.extend(f"  * {url}\n" for url in entry['changed'])
+            
+            parts.append(f"删除路径: {len(entry['deleted'])}个\n")
+            # 添加删除URL详情
+            parts.extend(f"  - {url}\n" for url in entry['deleted'])
+            
+            parts.append(f"总计提交: {entry['total']}个\n")
+        
+        return ''.join(parts)
     
     def cleanup_old_sitemaps(self, keep_count=1):
         """清理旧的sitemap文件，只保留指定数量的最新文件"""
-        sitemap_files = glob.glob(os.path.join(self.storage_dir, "sitemap_*.xml"))
-        
         # 按修改时间排序，最新的在前面
-        sitemap_files.sort(key=os.path.getmtime, reverse=True)
+        sitemap_entries = sorted(self._sitemap_entries(), key=lambda e: e.stat().st_mtime, reverse=True)
         
         # 删除旧文件，只保留指定数量的最新文件
-        if len(sitemap_files) > keep_count:
-            for old_file in sitemap_files[keep_count:]:
+        if len(sitemap_entries) > keep_count:
+            for old_entry in sitemap_entries[keep_count:]:
                 try:
-                    os.remove(old_file)
-                    print(f"已删除旧sitemap文件: {os.path.basename(old_file)}")
+                    os.remove(old_entry.path)
+                    print(f"已删除旧sitemap文件: {old_entry.name}")
                 except OSError as e:
-                    print(f"删除文件 {old_file} 失败: {e}")
+                    print(f"删除文件 {old_entry.path} 失败: {e}")
+            self._sitemap_entries_cache = None
     
     def run(self):
         """主执行流程"""
@@ -279,14 +532,33 @@ class SmartIndexNowSubmitter:
         print(f"开始时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
         print("=" * 50)
         
-        # 下载当前sitemap
+        # 记录的状态只对已保存的本地sitemap有效
+        if self.last_hash is not None and not self.get_latest_sitemap_file():
+            self.clear_sitemap_state()
+        
+        # 下载当前sitemap（边下载边写入临时文件并计算哈希）
         print("步骤 1/4: 下载当前sitemap...")
-        current_content = self.download_sitemap()
-        if not current_content:
+        new_filename = self.get_new_sitemap_filename()
+        download_result = self.download_sitemap(new_filename)
+        if not download_result:
             print("❌ 无法获取sitemap，程序退出")
             return False
+        if download_result is UNCHANGED:
+            print("✓ Sitemap未发生变化（HTTP 304），无需处理")
+            return True
             
-        current_hash = self.calculate_hash(current_content)
+        tmp_filename, current_hash = download_result
+        
+        # sitemap索引本身不变时子sitemap仍可能变化，
+        # 因此先下载解析全部子sitemap，以索引与URL列表的合并哈希判断是否变化
+        current_urls = None
+        if self._is_sitemap_index(tmp_filename):
+            current_urls = self.parse_sitemap_urls(tmp_filename)
+            if current_urls is None:
+                os.remove(tmp_filename)
+                print("❌ 无法获取或解析当前sitemap（含子sitemap），程序退出")
+                return False
+            current_hash = hashlib.sha256(current_hash.encode('ascii') + _json_dumps(current_urls)).hexdigest()
         
         # 查找最新的本地sitemap
         print("步骤 2/4: 查找本地sitemap...")
@@ -298,21 +570,36 @@ class SmartIndexNowSubmitter:
         urls_to_submit = []
         
         if latest_file:
-            # 读取本地sitemap并计算哈希
-            with open(latest_file, 'rb') as f:
-                previous_content = f.read()
-            previous_hash = self.calculate_hash(previous_content)
+            # 优先使用记录的哈希值，旧版本未记录时才读取本地sitemap计算
+            previous_hash = self.last_hash
+            if previous_hash is None:
+                previous_hash = self._hash_file(latest_file)
             
             # 比较哈希值
             if current_hash == previous_hash:
+                os.remove(tmp_filename)
+                if (self.last_hash, self.etag, self.last_modified) != (current_hash, self._response_etag, self._response_last_modified):
+                    self.save_sitemap_state(current_hash)
                 print("✓ Sitemap未发生变化，无需处理")
                 return True
             else:
                 print("✓ 检测到sitemap变化，开始分析具体变更...")
                 
                 # 解析两个sitemap
-                current_urls = self.parse_sitemap_urls(current_content)
-                previous_urls = self.parse_sitemap_urls(previous_content)
+                previous_urls = self.load_urls_cache(previous_hash)
+                if previous_urls is None:
+                    # 旧sitemap的子sitemap已无法获取历史版本，不再下载
+                    previous_urls = self.parse_sitemap_urls(latest_file, fetch_children=False)
+                if previous_urls is None:
+                    # 本地sitemap损坏时宁可重复提交，也不误报删除
+                    print("⚠️  本地sitemap解析失败，将当前所有URL视为新增")
+                    previous_urls = {}
+                if current_urls is None:
+                    current_urls = self.parse_sitemap_urls(tmp_filename)
+                if current_urls is None:
+                    os.remove(tmp_filename)
+                    print("❌ 无法获取或解析当前sitemap（含子sitemap），程序退出")
+                    return False
                 
                 # 比较URL变化
                 new_urls, changed_urls, deleted_urls = self.compare_urls_and_filter_changes(current_urls, previous_urls)
@@ -332,15 +619,20 @@ class SmartIndexNowSubmitter:
                 if not urls_to_submit:
                     print("✓ 没有需要提交的URL (只有删除或无关变更)")
                     # 虽然哈希变化但没有URL需要提交，我们仍然保存新的sitemap
-                    new_filename = self.get_new_sitemap_filename()
-                    self.save_sitemap(current_content, new_filename)
+                    if self.save_sitemap(tmp_filename, new_filename, current_hash):
+                        self.save_urls_cache(current_urls, current_hash)
                     # 清理旧的sitemap文件
                     self.cleanup_old_sitemaps(keep_count=1)
                     return True
         else:
             print("✓ 未找到本地sitemap，将提交所有URL")
             # 首次运行，提交所有URL
-            current_urls = self.parse_sitemap_urls(current_content)
+            if current_urls is None:
+                current_urls = self.parse_sitemap_urls(tmp_filename)
+            if current_urls is None:
+                os.remove(tmp_filename)
+                print("❌ 无法获取或解析当前sitemap（含子sitemap），程序退出")
+                return False
             urls_to_submit = list(current_urls.keys())
             new_urls = urls_to_submit  # 首次运行时所有URL都视为新增
             print(f"找到 {len(urls_to_submit)} 个URL")
@@ -354,8 +646,9 @@ class SmartIndexNowSubmitter:
             
         # 保存新的sitemap和提交记录
         print("步骤 4/4: 保存新的sitemap和提交记录...")
-        new_filename = self.get_new_sitemap_filename()
-        save_success = self.save_sitemap(current_content, new_filename)
+        save_success = self.save_sitemap(tmp_filename, new_filename, current_hash)
+        if save_success:
+            self.save_urls_cache(current_urls, current_hash)
         
         # 保存提交历史
         if urls_to_submit or deleted_urls:
@@ -371,11 +664,83 @@ class SmartIndexNowSubmitter:
             print("⚠️  处理过程中出现问题，请检查日志")
         
         return success
+    
+    def vuepress_path_to_url(self, file_path, source_dir="src", base="/"):
+        """将VuePress源文件路径映射为百分号编码的页面URL，非页面文件返回None"""
+        path = file_path.strip()
+        # 兼容git默认的路径引用格式，如"src/\345\215\232\345\256\242.md"
+        if len(path) >= 2 and path.startswith('"') and path.endswith('"'):
+            path = codecs.escape_decode(path[1:-1])[0].decode('utf-8')
+        path = posixpath.normpath(path.replace('\\', '/'))
+        prefix = posixpath.normpath(source_dir) + '/'
+        if source_dir not in ('', '.'):
+            if not path.startswith(prefix):
+                return None
+            path = path[len(prefix):]
+        
+        if not path.endswith('.md') or path.startswith('.vuepress/'):
+            return None
+        
+        # README.md对应目录首页，其余页面对应同名.html
+        directory, filename = posixpath.split(path[:-len('.md')])
+        if filename.lower() in ('readme', 'index'):
+            page = f"{directory}/" if directory else ""
+        else:
+            page = posixpath.join(directory, filename) + ".html"
+        # 站点部署在子路径时加上VuePress的base配置
+        base = '/' + base.strip('/') + '/' if base.strip('/') else '/'
+        # 与sitemap中<loc>的形式一致，非ASCII字符按UTF-8百分号编码
+        return f"https://{self.host}{quote(base + page)}"
+    
+    def run_from_changelist(self, file_paths, path_to_url):
+        """根据变更的源文件列表直接提交，无需下载和比较sitemap"""
+        print("=" * 50)
+        print("智能 IndexNow 提交工具（变更列表模式）")
+        print(f"目标网站: {self.host}")
+        print("=" * 50)
+        
+        urls_to_submit = []
+        seen = set()
+        for file_path in file_paths:
+            if not file_path.strip():
+                continue
+            url = path_to_url(file_path)
+            if not url:
+                print(f"跳过非页面文件: {file_path.strip()}")
+                continue
+            if url not in seen:
+                seen.add(url)
+                urls_to_submit.append(url)
+        
+        print(f"找到 {len(urls_to_submit)} 个变更的URL")
+        success = self.submit_to_indexnow(urls_to_submit)
+        
+        if urls_to_submit:
+            self.save_submission_history([], urls_to_submit, [], len(urls_to_submit))
+        
+        return success
 
 def main():
+    parser = argparse.ArgumentParser(description="智能 IndexNow 提交工具")
+    parser.add_argument("--from-stdin", action="store_true",
+                        help="从标准输入读取变更的Markdown文件路径（每行一个），直接提交对应URL")
+    parser.add_argument("--source-dir", default="src",
+                        help="VuePress源文件目录，用于将Markdown路径映射为URL（默认: src）")
+    parser.add_argument("--base", default="/",
+                        help="VuePress配置中的base，站点部署在子路径时使用（默认: /）")
+    args = parser.parse_args()
+    
     # 创建提交器实例并运行
     submitter = SmartIndexNowSubmitter()
-    submitter.run()
+    if args.from_stdin:
+        # git输出的路径为UTF-8，不能按系统区域编码（如Windows的cp936）解码
+        stdin = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8-sig')
+        submitter.run_from_changelist(
+            stdin,
+            lambda path: submitter.vuepress_path_to_url(path, args.source_dir, args.base)
+        )
+    else:
+        submitter.run()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file